@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import aiosqlite
+
+# Columns a job record may carry besides its id
+JOB_FIELDS = ("status", "output", "subtitles", "error", "code")
+
+
+class JobStore:
+    """Job status and transcript segments, shared by every worker process.
+
+    Backed by one SQLite file in WAL mode, so ``uvicorn --workers N`` can
+    answer /status and /events for a job no matter which worker runs it.
+    Segments get a store-wide sequence number; readers page through them
+    with ``segments(job_id, after=last_seq)``.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._db: Optional[aiosqlite.Connection] = None
+
+    async def open(self) -> None:
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT, output TEXT, subtitles TEXT, error TEXT, code INTEGER)"
+        )
+        await self._db.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        await self._db.execute("CREATE INDEX IF NOT EXISTS segments_job ON segments (job_id, seq)")
+        await self._db.commit()
+
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def create(self, job_id: str, **fields) -> None:
+        await self._db.execute("INSERT INTO jobs (id) VALUES (?)", (job_id,))
+        await self.set(job_id, **fields)
+
+    async def set(self, job_id: str, **fields) -> None:
+        unknown = set(fields) - set(JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown job fields: {', '.join(sorted(unknown))}")
+        if fields:
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            await self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        await self._db.commit()
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        async with self._db.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)) as cur:
+            row = await cur.fetchone()
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+    async def add_segments(self, job_id: str, segments: Sequence[Dict]) -> None:
+        await self._db.executemany(
+            "INSERT INTO segments (job_id, data) VALUES (?, ?)",
+            [(job_id, json.dumps(seg, ensure_ascii=False)) for seg in segments],
+        )
+        await self._db.commit()
+
+    async def segments(self, job_id: str, after: int = 0) -> List[tuple]:
+        """Return ``(seq, segment)`` pairs added after sequence number ``after``."""
+        async with self._db.execute(
+            "SELECT seq, data FROM segments WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+        ) as cur:
+            rows = await cur.fetchall()
+        return [(seq, json.loads(data)) for seq, data in rows]
@@ -1,342 +1,271 @@
-from fastapi import FastAPI, UploadFile, HTTPException, BackgroundTasks, Form
-from fastapi.responses import HTMLResponse, FileResponse
+import asyncio
+import json
+import os
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Header
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-import shutil
 from uuid import uuid4
-from typing import Dict
-
-from app.pipeline import transcribe_video, burn_subtitles
+from urllib.parse import quote, unquote
+import aiofiles
+
+from app.pipeline import (
+    transcribe_stream,
+    burn_subtitles_streaming,
+    preload_models,
+    check_gemini,
+    SUBTITLE_MODES,
+    TranslationUnavailable,
+)
+from app.jobs import JobStore
+from app.uploads import InvalidUpload, save_multipart_upload
 
 STORAGE_DIR = Path("storage")
 STORAGE_DIR.mkdir(exist_ok=True)
 
+
+class _GZipExcept:
+    """GZip responses, except under prefixes that must stream unbuffered or are already compressed."""
+
+    def __init__(self, app, skip_prefixes=(), minimum_size: int = 1024):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.skip_prefixes = tuple(skip_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
+
+
+class _CacheControl:
+    """Add a Cache-Control header to successful responses for the frontend's static assets."""
+
+    def __init__(self, app, paths=(), prefixes=(), value: str = "public, max-age=3600"):
+        self.app = app
+        self.paths = set(paths)
+        self.prefixes = tuple(prefixes)
+        self.header = (b"cache-control", value.encode())
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not (path in self.paths or path.startswith(self.prefixes)):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message["headers"] = [*message.get("headers", []), self.header]
+            await send(message)
+
+        await self.app(scope, receive, send_with_header)
+
+
 app = FastAPI(title="Subtitle Birth: VideoComm", docs_url=None, redoc_url=None)
+# Videos are already compressed (and served with Range); SSE must not be buffered.
+app.add_middleware(_GZipExcept, skip_prefixes=("/storage/", "/events/"), minimum_size=1024)
+app.add_middleware(_CacheControl, paths=("/", "/index.html"), prefixes=("/static/",))
 app.mount("/storage", StaticFiles(directory=str(STORAGE_DIR)), name="storage")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # -------- Job storage --------
-JOBS: Dict[str, dict] = {}
+# Shared by all worker processes; kept outside STORAGE_DIR so it isn't served.
+store = JobStore(Path(os.getenv("JOBS_DB", "jobs.db")))
+
+
+@app.on_event("startup")
+async def _open_store():
+    await store.open()
+
+
+@app.on_event("shutdown")
+async def _close_store():
+    await store.close()
+
+
+@app.on_event("startup")
+def _warm_models():
+    preload_models("base")
 
 # -------- Background task --------
 
-def _background_burn(job_id: str, video_path: Path, srt_path: Path, target_lang: str):
+async def _process_job(job_id: str, video_path: Path, target_lang: str, mode: str):
+    """Transcribe and burn as a producer/consumer pipeline.
+
+    Translated chunks are handed to the burner through a queue as they
+    arrive, so ffmpeg encodes the start of the video while later chunks are
+    still being translated.
+    """
+    chunks: asyncio.Queue = asyncio.Queue()
+    burner = asyncio.create_task(burn_subtitles_streaming(video_path, chunks, STORAGE_DIR, target_lang, mode))
     try:
-        out_path = burn_subtitles(video_path, srt_path, STORAGE_DIR, target_lang)
-        JOBS[job_id].update({"status": "done", "output": out_path.name})
+        async for chunk in transcribe_stream(video_path, STORAGE_DIR, target_lang=target_lang):
+            await chunks.put(chunk)
+            await store.add_segments(job_id, [
+                {"i": chunk["offset"] + n, "start": seg["start"], "end": seg["end"], "text": seg["text"]}
+                for n, seg in enumerate(chunk["segments"])
+            ])
+        await chunks.put(None)
+        await store.set(job_id, status="burning")
+
+        out_path = await burner
+        subtitles = out_path.with_suffix(".vtt").name if mode == "soft" else None
+        await store.set(job_id, status="done", output=out_path.name, subtitles=subtitles)
     except Exception as e:
-        JOBS[job_id].update({"status": "error", "error": str(e)})
+        print(f"Job {job_id} failed: {e}")
+        burner.cancel()
+        # Wait for it to stop (and any ffmpeg run to exit) and collect its result or error.
+        await asyncio.gather(burner, return_exceptions=True)
+        # 503: translation service unavailable, worth retrying later
+        code = 503 if isinstance(e, TranslationUnavailable) else 500
+        await store.set(job_id, status="error", error=str(e), code=code)
 
 # -------- Routes --------
 
-@app.post("/upload")
-async def upload_video(background_tasks: BackgroundTasks, file: UploadFile, lang: str = Form("en")):
-    if not file.content_type or not file.content_type.startswith("video"):
-        raise HTTPException(400, "Please upload a video file")
+def _input_path(job_id: str, filename: str) -> Path:
+    return STORAGE_DIR / f"{job_id}_{Path(filename).name}"
 
-    job_id = str(uuid4())
-    input_path = STORAGE_DIR / f"{job_id}_{file.filename}"
-    with open(input_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
 
-    # Immediate transcription (synchronous) for instant user feedback
-    try:
-        segments, srt_path = transcribe_video(input_path, STORAGE_DIR, target_lang=lang)
-    except Exception as e:
-        print(f"Transcription error: {e}")
-        raise HTTPException(500, f"Transcription failed: {e}")
+def _check_mode(mode: str) -> None:
+    if mode not in SUBTITLE_MODES:
+        raise HTTPException(400, f"mode must be one of {', '.join(SUBTITLE_MODES)}")
 
-    transcript_text = "\n".join(seg["text"] for seg in segments)
 
-    JOBS[job_id] = {"status": "burning", "transcript": transcript_text, "output": None}
+async def _start_job(background_tasks: BackgroundTasks, job_id: str, input_path: Path, lang: str, mode: str) -> dict:
+    await store.create(job_id, status="transcribing")
 
-    # Burn subtitles in background
-    background_tasks.add_task(_background_burn, job_id, input_path, srt_path, lang)
+    # Transcribe and burn in background; progress is streamed via /events
+    background_tasks.add_task(_process_job, job_id, input_path, lang, mode)
 
     return {"job_id": job_id}
 
 
+@app.post("/upload")
+async def upload_video(request: Request, background_tasks: BackgroundTasks):
+    """Multipart upload (fields: file, lang, mode), parsed straight from the request stream."""
+    job_id = str(uuid4())
+    try:
+        input_path, fields = await save_multipart_upload(
+            request, "file", lambda filename: _input_path(job_id, filename)
+        )
+    except InvalidUpload as e:
+        raise HTTPException(400, str(e))
+
+    lang, mode = fields.get("lang", "en"), fields.get("mode", "soft")
+    try:
+        _check_mode(mode)
+    except HTTPException:
+        input_path.unlink(missing_ok=True)
+        raise
+
+    return await _start_job(background_tasks, job_id, input_path, lang, mode)
+
+
+@app.post("/upload/stream")
+async def upload_video_stream(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    lang: str = "en",
+    mode: str = "soft",
+    x_filename: str = Header(...),
+):
+    """Raw-body upload: the request body is the video itself, named by the X-Filename header.
+
+    Skips multipart parsing and Starlette's temp-file spooling, so the body is
+    written to disk exactly once as it arrives.
+    """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("video"):
+        raise HTTPException(400, "Please upload a video file")
+    _check_mode(mode)
+
+    job_id = str(uuid4())
+    input_path = _input_path(job_id, unquote(x_filename))
+    try:
+        async with aiofiles.open(input_path, "wb") as buffer:
+            async for chunk in request.stream():
+                await buffer.write(chunk)
+    except BaseException:
+        # Client disconnect mid-body: don't leave a partial upload behind
+        input_path.unlink(missing_ok=True)
+        raise
+
+    return await _start_job(background_tasks, job_id, input_path, lang, mode)
+
+
 @app.get("/status/{job_id}")
-def job_status(job_id: str):
-    job = JOBS.get(job_id)
+async def job_status(job_id: str):
+    job = await store.get(job_id)
     if not job:
         raise HTTPException(404, "job not found")
     return job
 
 
+EVENTS_POLL_INTERVAL = 0.5  # seconds between job store reads per stream
+EVENTS_KEEPALIVE = 15  # seconds between keep-alive comments on idle streams
+
+
+@app.get("/events/{job_id}")
+async def job_events(job_id: str):
+    """Server-Sent Events: one message per transcript segment as it is produced.
+
+    Also emits ``status`` events on stage changes and a final ``end`` event
+    once the job is done or failed; the result itself is read from /status.
+    """
+    if await store.get(job_id) is None:
+        raise HTTPException(404, "job not found")
+
+    async def stream():
+        # The job may be running in another worker, so follow it through the store.
+        last_seq, last_status, idle = 0, None, 0.0
+        while True:
+            # Status first: once it reads done/error, every segment is already stored.
+            status = (await store.get(job_id))["status"]
+            new_segments = await store.segments(job_id, after=last_seq)
+            if not new_segments and status == last_status:
+                await asyncio.sleep(EVENTS_POLL_INTERVAL)
+                idle += EVENTS_POLL_INTERVAL
+                if idle >= EVENTS_KEEPALIVE:
+                    idle = 0.0
+                    yield ": keep-alive\n\n"
+                continue
+            idle = 0.0
+            for seq, seg in new_segments:
+                last_seq = seq
+                yield f"data: {json.dumps(seg, ensure_ascii=False)}\n\n"
+            if status != last_status:
+                last_status = status
+                yield f"event: status\ndata: {json.dumps({'status': status})}\n\n"
+            if status in ("done", "error"):
+                yield "event: end\ndata: {}\n\n"
+                return
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/healthz")
+async def healthz(deep: bool = False):
+    """Liveness check. ``?deep=true`` also round-trips a prompt to Gemini."""
+    if deep:
+        try:
+            await check_gemini()
+        except TranslationUnavailable as e:
+            raise HTTPException(503, str(e))
+    return {"status": "ok"}
+
+
 @app.get("/download/{file_name}")
-async def download(file_name: str):
-    file_path = STORAGE_DIR / file_name
-    if not file_path.exists():
-        raise HTTPException(404, "File not found")
-    return FileResponse(path=file_path, filename=file_name, media_type="video/mp4")
+def download(file_name: str):
+    # Kept for old links. Files are served by the /storage mount, which handles
+    # Range requests for <video> seeking; the page's download button sets the
+    # <a download> attribute to force a save.
+    return RedirectResponse(f"/storage/{quote(file_name)}", status_code=307)
 
 
 # -------- Frontend --------
-@app.get("/", response_class=HTMLResponse)
-def index():
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset='utf-8'>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <title>Subtitle Birth: VideoComm</title>
-        <link href='https://fonts.googleapis.com/css2?family=Poppins:wght@300;500;700&display=swap' rel='stylesheet'>
-        <style>
-            :root{--brand:#e6007e;--bg:#ffeaf4;--card:#fff}
-            body{
-                font-family:'Poppins',sans-serif;
-                background:var(--bg);
-                color:#333;
-                margin:0;
-                display:flex;
-                flex-direction:column;
-                align-items:center;
-                gap:1.5rem;
-                padding:2rem;
-                min-height:100vh;
-            }
-            h1{
-                color:var(--brand);
-                margin:0;
-                font-size:2.5rem;
-                font-family:'M PLUS Rounded 1c',sans-serif;
-                letter-spacing:1.5px;
-            }
-            #drop-area{
-                border:2px dashed var(--brand);
-                border-radius:16px;
-                padding:3rem;
-                width:90%;
-                max-width:600px;
-                text-align:center;
-                cursor:pointer;
-                transition:background .2s;
-                background:rgba(255,255,255,0.6);
-            }
-            #drop-area.hover{background:#fff3f9}
-            #drop-area svg{width:4rem;height:auto;fill:var(--brand)}
-            
-            .btn{
-                background:var(--brand);
-                color:#fff;
-                border:none;
-                padding:.6rem 1.2rem;
-                border-radius:8px;
-                font-size:1rem;
-                cursor:pointer;
-                transition:transform .2s;
-            }
-            .btn:hover{transform:translateY(-2px)}
-            
-            #langSelect{
-                padding:.5rem;
-                border-radius:8px;
-                border:1px solid #ccc;
-                font-size:1rem;
-            }
-            
-            #status{text-align:center;color:#555;min-height:1.4em}
-            
-            #transcriptWrap{
-                width:90%;
-                max-width:800px;
-                background:var(--card);
-                border-radius:12px;
-                border:1px solid #ffd0e6;
-                padding:1rem;
-                display:none;
-                max-height:30vh;
-                overflow:hidden;
-            }
-            #transcriptWrap.expanded{max-height:70vh}
-            #transcript{white-space:pre-wrap;margin:0;line-height:1.5}
-            
-            #seeMore{
-                margin-top:1rem;
-                padding:.5rem 1rem;
-                background:var(--brand);
-                color:#fff;
-                border:none;
-                border-radius:20px;
-                cursor:pointer;
-            }
-            
-            #tvFrame{position:relative;display:none}
-            #tvFrame img{width:90%;max-width:800px;height:auto;display:block}
-            #resultVideo{
-                position:absolute;
-                top:13.5%;
-                left:12.5%;
-                width:75%;
-                height:61%;
-                border:none;
-                border-radius:4px;
-                object-fit:cover;
-                z-index:1;
-                background:#000;
-            }
-            
-            #downloadBtn{
-                margin-top:1rem;
-                padding:.6rem 1.4rem;
-                background:var(--brand);
-                color:#fff;
-                border:none;
-                border-radius:20px;
-                font-weight:600;
-                cursor:pointer;
-                display:none;
-            }
-            
-            #procFooter{
-                position:fixed;
-                bottom:20px;
-                left:50%;
-                transform:translateX(-50%);
-                width:300px;
-                height:8px;
-                background:#ffd0e6;
-                border-radius:4px;
-                overflow:hidden;
-                display:none;
-            }
-            #procBar{
-                width:40%;
-                height:100%;
-                background:var(--brand);
-                animation:moveBar 1s linear infinite;
-            }
-            @keyframes moveBar{
-                from{transform:translateX(-100%)}
-                to{transform:translateX(100%)}
-            }
-        </style>
-    </head>
-    <body>
-        <h1>Subtitle Birth: VideoComm</h1>
-
-        <div id='drop-area'>
-            <svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 24 24'>
-                <path d='M12 16l4-5h-3V4h-2v7H8l4 5z'/>
-                <path d='M20 18H4v2h16v-2z'/>
-            </svg>
-            <p>Drop a video here or click to select</p>
-        </div>
-
-        <select id='langSelect'>
-            <option value='en' selected>English</option>
-            <option value='ur'>Urdu</option>
-            <option value='hi'>Hindi</option>
-            <option value='ar'>Arabic</option>
-            <option value='fr'>French</option>
-        </select>
-
-        <button id='uploadBtn' class='btn'>Upload Video</button>
-        <input type='file' id='fileElem' accept='video/*' style='display:none'>
-
-        <div id='status'></div>
-
-        <div id='transcriptWrap'>
-            <pre id='transcript'></pre>
-            <button id='seeMore'>See more</button>
-        </div>
-
-        <div id='tvFrame'>
-            <img src='/static/tv.png' alt='TV frame'>
-            <video id='resultVideo' controls></video>
-        </div>
-        <button id='downloadBtn'>Download video</button>
-
-        <div id='procFooter'><div id='procBar'></div></div>
-
-<script>
-const dropArea=document.getElementById('drop-area');
-const langSelect=document.getElementById('langSelect');
-const uploadBtn=document.getElementById('uploadBtn');
-const fileInput=document.getElementById('fileElem');
-const statusEl=document.getElementById('status');
-const transcriptEl=document.getElementById('transcript');
-const transcriptWrap=document.getElementById('transcriptWrap');
-const seeMoreBtn=document.getElementById('seeMore');
-const videoEl=document.getElementById('resultVideo');
-const tvFrame=document.getElementById('tvFrame');
-const dlBtn=document.getElementById('downloadBtn');
-const procFooter=document.getElementById('procFooter');
-let pollInterval=null, expanded=false;
-
-function setStatus(t){statusEl.textContent=t;}
-
-function handleFile(file){
-    setStatus('Uploading…');
-    transcriptWrap.style.display='none';
-    videoEl.style.display='none';
-    const fd=new FormData(); 
-    fd.append('file',file);
-    fd.append('lang', langSelect.value);
-    fetch('/upload',{method:'POST',body:fd})
-      .then(r=>r.json())
-      .then(({job_id})=>{
-        setStatus('Transcribing…');
-        pollInterval=setInterval(()=>checkStatus(job_id),1200);
-      }).catch(e=>setStatus('Error: '+e.message));
-}
-
-function applyCollapsed(){
-    if(!expanded){
-        transcriptWrap.classList.remove('expanded');
-        seeMoreBtn.textContent='See more';
-    }else{
-        transcriptWrap.classList.add('expanded');
-        seeMoreBtn.textContent='See less';
-    }
-}
-
-seeMoreBtn.addEventListener('click',()=>{
-    expanded=!expanded;
-    applyCollapsed();
-});
-
-function checkStatus(job_id){
-    fetch('/status/'+job_id)
-      .then(r=>r.json())
-      .then(d=>{
-        if(d.status==='burning'){
-            transcriptEl.textContent=d.transcript||'';
-            procFooter.style.display='block';
-            transcriptWrap.style.display='block';
-            expanded=false; applyCollapsed();
-            setStatus('Adding subtitles to video…');
-        }else if(d.status==='done'){
-            clearInterval(pollInterval);
-            setStatus('Complete!');
-            transcriptWrap.style.display='none';
-            procFooter.style.display='none';
-            videoEl.src='/storage/'+d.output;
-            tvFrame.style.display='block';
-            dlBtn.style.display='inline-block';
-            dlBtn.onclick=()=>window.open('/storage/'+d.output,'_blank');
-        }else if(d.status==='error'){
-            clearInterval(pollInterval);
-            setStatus('Error: '+d.error);
-        }
-      }).catch(()=>{});
-}
-
-/* Drag & click */
-['dragenter','dragover'].forEach(evt=>dropArea.addEventListener(evt,e=>{e.preventDefault();dropArea.classList.add('hover');}));
-['dragleave','drop'].forEach(evt=>dropArea.addEventListener(evt,e=>{e.preventDefault();dropArea.classList.remove('hover');}));
-dropArea.addEventListener('drop',e=>{const f=e.dataTransfer.files?.[0]; if(f) handleFile(f);});
-dropArea.addEventListener('click',e=>{if(e.target!==langSelect && e.target!==uploadBtn) fileInput.click();});
-uploadBtn.addEventListener('click',(e)=>{
-    e.preventDefault();
-    e.stopPropagation();
-    console.log('Upload button clicked');
-    fileInput.click();
-});
-fileInput.addEventListener('change',e=>{const f=e.target.files?.[0]; if(f) handleFile(f);});
-</script>
-    </body>
-    </html>
-    """
\ No newline at end of file
+# Mounted last so the API routes above take precedence; serves static/index.html at "/".
+app.mount("/", StaticFiles(directory="static", html=True), name="root")
@@ -1,10 +1,27 @@
 from pathlib import Path
-import whisper
 import ffmpeg
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, AsyncIterator, Sequence
 import os
+import json
+import hashlib
+import re
+import threading
+import time
+import asyncio
+import functools
+import math
+import subprocess
+import sys
+import ctranslate2
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import TranscriptionOptions, get_compression_ratio, get_suppressed_tokens
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps, merge_segments
+import numpy as np
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
 # for dubbing
 # from TTS.api import TTS   # Coqui XTTS v2 or OpenVoice
@@ -12,38 +29,495 @@ import tempfile
 
 # Load API key from .env
 load_dotenv()
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if not gemini_api_key:
-    raise RuntimeError("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=gemini_api_key)
-
-try:
-    _GEMINI_MODEL = genai.GenerativeModel("gemini-1.5-flash")
-    # Test the model with a simple prompt
-    test_resp = _GEMINI_MODEL.generate_content("Hello")
-    print("Gemini model initialized successfully")
-except Exception as e:
-    print(f"Error initializing Gemini model: {e}")
-    raise RuntimeError(f"Failed to initialize Gemini model: {e}")
+
+
+class TranslationUnavailable(RuntimeError):
+    """Gemini is not configured or its API refused the request."""
+
+
+# Created on first use so importing this module never needs the API key or network.
+_GEMINI_MODEL: Optional[genai.GenerativeModel] = None
+_GEMINI_LOCK = threading.Lock()
+
+
+def _get_gemini() -> genai.GenerativeModel:
+    global _GEMINI_MODEL
+    if _GEMINI_MODEL is None:
+        with _GEMINI_LOCK:
+            if _GEMINI_MODEL is None:
+                gemini_api_key = os.getenv("GEMINI_API_KEY")
+                if not gemini_api_key:
+                    raise TranslationUnavailable("GEMINI_API_KEY not found in environment variables")
+                genai.configure(api_key=gemini_api_key)
+                _GEMINI_MODEL = genai.GenerativeModel("gemini-1.5-flash")
+    return _GEMINI_MODEL
+
+
+async def check_gemini() -> None:
+    """Round-trip a tiny prompt; raises TranslationUnavailable if Gemini can't be reached."""
+    try:
+        await _get_gemini().generate_content_async("Hello")
+    except google_exceptions.GoogleAPIError as e:
+        raise TranslationUnavailable(f"Gemini API error: {e}") from e
+
+# Whisper models are loaded once per process and shared by every request;
+# reloading per upload re-reads the weights and reallocates GPU memory.
+_WHISPER_MODELS: Dict[str, WhisperModel] = {}
+_WHISPER_LOCK = threading.Lock()
+
+
+def _whisper_compute_type() -> str:
+    """int8 weights; float16 activations on GPU (WHISPER_COMPUTE_TYPE overrides)."""
+    override = os.getenv("WHISPER_COMPUTE_TYPE")
+    if override:
+        return override
+    return "int8_float16" if ctranslate2.get_cuda_device_count() > 0 else "int8"
+
+
+def _get_whisper(model_size: str) -> WhisperModel:
+    """Return the process-wide Whisper model for ``model_size``, loading it on first use."""
+    model = _WHISPER_MODELS.get(model_size)
+    if model is None:
+        with _WHISPER_LOCK:
+            model = _WHISPER_MODELS.get(model_size)
+            if model is None:
+                print(f"Loading Whisper model '{model_size}'...")
+                model = WhisperModel(model_size, device="auto", compute_type=_whisper_compute_type())
+                _WHISPER_MODELS[model_size] = model
+    return model
+
+
+def preload_models(model_size: str = "base") -> None:
+    """Warm the Whisper model and pick the video encoder so the first request pays for neither."""
+    _get_whisper(model_size)
+    detect_video_encoder()
 
 # preload TTS model once
 # XTTS v2 supports cross-lingual cloning with reference audio
 # tts_model = TTS("tts_models/multilingual/multi-dataset/xtts_v2")
 
 
-def _srt_time(seconds: float) -> str:
-    """Convert seconds to SRT timestamp format (HH:MM:SS,ms)."""
-    ms = int(float(seconds or 0) * 1000)
-    return f"{ms//3600000:02d}:{(ms%3600000)//60000:02d}:{(ms%60000)//1000:02d},{ms%1000:03d}"
+def _srt_times(seconds: List[float], sep: str = ",") -> List[str]:
+    """Convert seconds to SRT timestamps (HH:MM:SS,ms); pass sep="." for WebVTT.
+
+    The h/m/s/ms split runs as NumPy divmods over the whole array, which
+    matters for long videos where this is called for thousands of cues.
+    """
+    ms = (np.array([t or 0 for t in seconds], dtype=np.float64) * 1000).astype(np.int64)
+    h, rem = np.divmod(ms, 3600000)
+    m, rem = np.divmod(rem, 60000)
+    s, ms = np.divmod(rem, 1000)
+    return [
+        f"{hh:02d}:{mm:02d}:{ss:02d}{sep}{mss:03d}"
+        for hh, mm, ss, mss in zip(h.tolist(), m.tolist(), s.tolist(), ms.tolist())
+    ]
+
+
+def _cue_times(segments, sep: str = ",") -> Tuple[List[str], List[str]]:
+    """Return (start timestamps, end timestamps) for all segments in one vectorized pass."""
+    times = _srt_times([seg["start"] for seg in segments] + [seg["end"] for seg in segments], sep)
+    return times[: len(segments)], times[len(segments) :]
+
+
+def _write_vtt(segments, path: Path) -> None:
+    """Write transcription segments to a WebVTT file (for the browser's <track>)."""
+    starts, ends = _cue_times(segments, ".")
+    Path(path).write_text(
+        "WEBVTT\n\n"
+        + "".join(
+            f"{start} --> {end}\n{seg['text'].strip()}\n\n"
+            for seg, start, end in zip(segments, starts, ends)
+        ),
+        encoding="utf-8",
+    )
 
 
 def _write_srt(segments, path: Path) -> None:
-    """Write transcription segments to an SRT file."""
-    with open(path, "w", encoding="utf-8") as f:
-        for i, seg in enumerate(segments, 1):
-            f.write(
-                f"{i}\n{_srt_time(seg['start'])} --> {_srt_time(seg['end'])}\n{seg['text'].strip()}\n\n"
+    """Write transcription segments to an SRT file in a single write."""
+    starts, ends = _cue_times(segments)
+    Path(path).write_text(
+        "".join(
+            f"{i}\n{start} --> {end}\n{seg['text'].strip()}\n\n"
+            for i, (seg, start, end) in enumerate(zip(segments, starts, ends), 1)
+        ),
+        encoding="utf-8",
+    )
+
+
+# -------- Caches --------
+# Transcripts and extracted audio live under CACHE_DIR, which must stay outside
+# the publicly served storage directory (like the job database).
+CACHE_DIR = Path(os.getenv("CACHE_DIR", ".cache"))
+
+# -------- Transcript cache --------
+# Finished transcripts are stored under CACHE_DIR/transcripts keyed by
+# the SHA-256 of the uploaded file plus the model size and target language, so a
+# repeat upload of the same video skips Whisper (and translation) entirely.
+# Set NO_TRANSCRIPT_CACHE=1 to disable.
+
+# Part of every cache key; bump it whenever the transcription or translation
+# pipeline changes what it produces, so older entries are no longer served.
+TRANSCRIPT_CACHE_VERSION = 2
+
+def _transcript_cache_enabled() -> bool:
+    return os.getenv("NO_TRANSCRIPT_CACHE", "") not in ("1", "true", "yes")
+
+
+def _file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Hash a file in 1 MiB chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _transcript_cache_path(video_hash: str, model_size: str, target_lang: str) -> Path:
+    key = hashlib.sha256(
+        f"v{TRANSCRIPT_CACHE_VERSION}:{video_hash}:{model_size}:{target_lang}".encode()
+    ).hexdigest()
+    return CACHE_DIR / "transcripts" / f"{key}.json"
+
+
+def _load_cached_transcript(cache_path: Path) -> Optional[List[Dict]]:
+    """Return cached segments, or None on a miss or an unreadable entry."""
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            segments = json.load(f)["segments"]
+        if not isinstance(segments, list):
+            raise ValueError("segments is not a list")
+        return segments
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring corrupt transcript cache entry {cache_path.name}: {e}")
+        return None
+
+
+def _store_cached_transcript(cache_path: Path, segments: List[Dict], **metadata) -> None:
+    """Atomically write segments + metadata to the cache (tmp file + os.replace)."""
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**metadata, "segments": segments}, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write transcript cache: {e}")
+
+
+# -------- Audio extraction --------
+
+SAMPLE_RATE = 16000  # Whisper's input rate
+
+# Bounds on the PCM cache (about 115 MB per hour of audio); least recently
+# used entries go first once it grows past AUDIO_CACHE_MAX_MB.
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048")) * 1024 * 1024
+AUDIO_CACHE_MAX_AGE = float(os.getenv("AUDIO_CACHE_MAX_AGE_HOURS", "24")) * 3600
+
+def _extract_pcm(video_path: Path) -> bytes:
+    """Decode only the audio track to the 16 kHz mono s16le PCM Whisper expects."""
+    try:
+        out, _ = (
+            ffmpeg.input(str(video_path))
+            .output("-", format="s16le", acodec="pcm_s16le", ac=1, ar=SAMPLE_RATE, vn=None)
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"Failed to extract audio: {e.stderr.decode() if e.stderr else e}") from e
+    return out
+
+
+def _prune_audio_cache(cache_dir: Path) -> None:
+    """Drop entries older than AUDIO_CACHE_MAX_AGE, then the least recently used until under the size cap."""
+    entries = []
+    for path in cache_dir.glob("*.pcm"):
+        try:
+            st = path.stat()
+        except FileNotFoundError:  # removed by another worker
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort(key=lambda e: e[0], reverse=True)  # newest first
+
+    now = time.time()
+    total = 0
+    for mtime, size, path in entries:
+        total += size
+        if now - mtime > AUDIO_CACHE_MAX_AGE or total > AUDIO_CACHE_MAX_BYTES:
+            path.unlink(missing_ok=True)
+
+
+def _load_audio(video_path: Path, video_hash: Optional[str]) -> np.ndarray:
+    """Return the video's audio as float32 samples, cached under CACHE_DIR/audio by video hash.
+
+    The PCM cache lets the same upload be re-transcribed for another target
+    language without decoding the file again.
+    """
+    cache_path = CACHE_DIR / "audio" / f"{video_hash}.pcm" if video_hash else None
+    pcm = None
+    if cache_path is not None:
+        try:
+            pcm = cache_path.read_bytes()
+            os.utime(cache_path)  # mark as recently used for _prune_audio_cache
+        except OSError:
+            pcm = None
+    if pcm is None:
+        pcm = _extract_pcm(video_path)
+        if cache_path is not None:
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+                tmp_path.write_bytes(pcm)
+                os.replace(tmp_path, cache_path)
+                _prune_audio_cache(cache_path.parent)
+            except OSError as e:
+                print(f"Could not write audio cache: {e}")
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+# -------- Batched Whisper inference --------
+
+# Whisper's temperature schedule for chunks whose greedy decode fails the quality checks
+_FALLBACK_TEMPERATURES = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]
+
+
+def _decode_options(tokenizer: Tokenizer, temperatures: Sequence[float] = (0.0,)) -> TranscriptionOptions:
+    """faster-whisper's batched-transcription defaults, greedy and with timestamps on.
+
+    Segment timestamps keep cues sentence-sized instead of one per 30 s speech chunk.
+    """
+    return TranscriptionOptions(
+        beam_size=1,
+        best_of=5,
+        patience=1,
+        length_penalty=1,
+        repetition_penalty=1,
+        no_repeat_ngram_size=0,
+        log_prob_threshold=-1.0,
+        no_speech_threshold=0.6,
+        compression_ratio_threshold=2.4,
+        condition_on_previous_text=False,
+        prompt_reset_on_temperature=0.5,
+        temperatures=list(temperatures),
+        initial_prompt=None,
+        prefix=None,
+        suppress_blank=True,
+        suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+        without_timestamps=False,
+        max_initial_timestamp=0.0,
+        word_timestamps=False,
+        prepend_punctuations="\"'“¿([{-",
+        append_punctuations="\"'.。,，!！?？:：”)]}、",
+        multilingual=False,
+        max_new_tokens=None,
+        clip_timestamps=[],
+        hallucination_silence_threshold=None,
+        hotwords=None,
+    )
+
+
+def _needs_fallback(chunk: List[Dict], options: TranscriptionOptions) -> bool:
+    """Whisper's checks on a decoded chunk: too repetitive or too unlikely, unless it is silence."""
+    if not chunk:
+        return False
+    avg_logprob, no_speech_prob = chunk[0]["avg_logprob"], chunk[0]["no_speech_prob"]
+    if no_speech_prob > options.no_speech_threshold and avg_logprob < options.log_prob_threshold:
+        return False
+    text = "".join(seg["text"] for seg in chunk)
+    return get_compression_ratio(text) > options.compression_ratio_threshold or avg_logprob < options.log_prob_threshold
+
+
+class _TranscriptionJob:
+    """One upload's speech chunks, waiting to be decoded by TranscriptionBatcher."""
+
+    def __init__(self, task: str, language: str, features: List[np.ndarray], metadata: List[Dict]):
+        self.task = task
+        self.language = language
+        self.features = features  # one (n_mels, 3000) log-mel array per VAD chunk
+        self.metadata = metadata  # chunk start/end times, as BatchedInferencePipeline.forward expects
+        self.next = 0  # index of the first chunk not yet decoded
+        self.previous_tokens: List[int] = []  # last decoded chunk, the prompt for a fallback decode
+        self.results: asyncio.Queue = asyncio.Queue()  # segment lists, then None or an exception
+        self.cancelled = False
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        # Chunks share one decode call only if they share the task/language prompt.
+        return self.task, self.language
+
+
+class TranscriptionBatcher:
+    """Run concurrent uploads through the shared Whisper model in shared batches.
+
+    Each upload is split at silences into speech chunks of up to 30 s (Silero
+    VAD, as faster-whisper's BatchedInferencePipeline does). One background
+    task keeps a list of the uploads in progress. At each step it takes up to
+    ``batch_size`` pending chunks, round-robin across the uploads that share
+    a task and language, and decodes them in one call on a worker thread. A
+    chunk that fails Whisper's quality checks is re-decoded alone with its
+    temperature fallback, conditioned on the upload's previous chunk. The
+    results are then returned to each upload. Uploads that arrive mid-step
+    join the next step, so nobody waits for a batch to fill up, and each
+    upload receives its segments as soon as the step that decoded them ends.
+    """
+
+    def __init__(self, model_size: str = "base", batch_size: int = 16):
+        self.model_size = model_size
+        self.batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def transcribe(self, audio: np.ndarray, task: str = "transcribe") -> Tuple[str, AsyncIterator[List[Dict]]]:
+        """Queue 16 kHz mono ``audio``; return (detected language, segments).
+
+        ``segments`` is an async iterator of ``{"start", "end", "text"}`` lists,
+        one per decode step, in order. ``task="translate"`` has Whisper output
+        English whatever the spoken language.
+        """
+        job = await asyncio.to_thread(self._prepare, audio, task)
+        if not job.features:
+            return job.language, self._results(job)  # no speech: nothing to decode
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        await self._queue.put(job)
+        return job.language, self._results(job)
+
+    def _prepare(self, audio: np.ndarray, task: str) -> _TranscriptionJob:
+        """VAD, log-mel features and language detection for one upload (mirrors BatchedInferencePipeline)."""
+        model = _get_whisper(self.model_size)
+        vad = VadOptions(max_speech_duration_s=model.feature_extractor.chunk_length, min_silence_duration_ms=160)
+        clips = merge_segments(get_speech_timestamps(audio, vad), vad)
+        audio_chunks, metadata = collect_chunks(audio, clips)
+        features = [model.feature_extractor(chunk)[..., :-1] for chunk in audio_chunks] if clips else []
+
+        if not model.model.is_multilingual:
+            language = "en"
+        else:
+            # The extra column keeps detection well-defined when there is no speech.
+            padding = np.full((model.model.n_mels, 1), -1.5, dtype="float32")
+            language, _, _ = model.detect_language(features=np.concatenate(features + [padding], axis=1))
+        job = _TranscriptionJob(task, language, [pad_or_trim(f) for f in features], metadata)
+        if not features:
+            job.results.put_nowait(None)
+        return job
+
+    @staticmethod
+    async def _results(job: _TranscriptionJob) -> AsyncIterator[List[Dict]]:
+        try:
+            while (item := await job.results.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            job.cancelled = True  # finished, failed or abandoned: stop decoding it
+
+    def _next_batch(self, active: List[_TranscriptionJob]) -> List[Tuple[_TranscriptionJob, int]]:
+        """Pick up to batch_size (job, chunk index) pairs from the jobs sharing active[0]'s prompt."""
+        group = [job for job in active if job.key == active[0].key]
+        taken = {id(job): job.next for job in group}
+        batch: List[Tuple[_TranscriptionJob, int]] = []
+        while len(batch) < self.batch_size:
+            progressed = False
+            for job in group:
+                if taken[id(job)] < len(job.features) and len(batch) < self.batch_size:
+                    batch.append((job, taken[id(job)]))
+                    taken[id(job)] += 1
+                    progressed = True
+            if not progressed:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        active: List[_TranscriptionJob] = []
+        while True:
+            if not active:
+                active.append(await self._queue.get())
+            while not self._queue.empty():
+                active.append(self._queue.get_nowait())
+            active = [job for job in active if not job.cancelled]
+            if not active:
+                continue
+
+            batch = self._next_batch(active)
+            jobs = list({id(job): job for job, _ in batch}.values())
+            print(f"Transcribing batch of {len(batch)} chunk(s) from {len(jobs)} upload(s)")
+            try:
+                outputs = await asyncio.to_thread(self._decode_batch, batch)
+            except Exception as e:
+                for job in jobs:
+                    job.results.put_nowait(e)
+                    job.cancelled = True
+                continue
+
+            for job in jobs:
+                mine = [n for n, (j, _) in enumerate(batch) if j is job]
+                job.results.put_nowait([seg for n in mine for seg in outputs[n]])
+                job.next = batch[mine[-1]][1] + 1
+                if job.next == len(job.features):
+                    job.results.put_nowait(None)
+                    job.cancelled = True
+            # Move this group to the back so uploads with another task/language get the next step.
+            key = batch[0][0].key
+            active = [job for job in active if job.key != key] + [job for job in active if job.key == key]
+
+    def _decode_batch(self, batch: List[Tuple[_TranscriptionJob, int]]) -> List[List[Dict]]:
+        """Decode the chunks in ``batch`` (which share a task and language) in one model call."""
+        model = _get_whisper(self.model_size)
+        task, language = batch[0][0].key
+        tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task=task, language=language)
+        features = np.stack([job.features[i] for job, i in batch])
+        metadata = [job.metadata[i] for job, i in batch]
+        options = _decode_options(tokenizer)
+        outputs = BatchedInferencePipeline(model).forward(features, tokenizer, metadata, options)
+
+        results = []
+        # Batch order is chunk order within each job, so previous_tokens is always the chunk before.
+        for (job, i), chunk in zip(batch, outputs):
+            reset_prompt = False
+            if _needs_fallback(chunk, options):
+                chunk, temperature = self._redecode(model, tokenizer, job, i)
+                reset_prompt = temperature > options.prompt_reset_on_temperature
+            job.previous_tokens = [] if reset_prompt else [t for seg in chunk for t in seg["tokens"]]
+            results.append(
+                [{"start": round(seg["start"], 3), "end": round(seg["end"], 3), "text": seg["text"]} for seg in chunk]
             )
+        return results
+
+    def _redecode(
+        self, model: WhisperModel, tokenizer: Tokenizer, job: _TranscriptionJob, i: int
+    ) -> Tuple[List[Dict], float]:
+        """Decode chunk ``i`` alone the way WhisperModel.transcribe would; return (segments, final temperature)."""
+        temperatures = _FALLBACK_TEMPERATURES if job.previous_tokens else _FALLBACK_TEMPERATURES[1:]
+        options = _decode_options(tokenizer, temperatures)
+        prompt = model.get_prompt(tokenizer, job.previous_tokens, without_timestamps=options.without_timestamps)
+        encoder_output = model.encode(job.features[i])
+        result, _, temperature, _ = model.generate_with_fallback(encoder_output, prompt, tokenizer, options)
+
+        start, end = job.metadata[i]["start_time"], job.metadata[i]["end_time"]
+        subsegments, _, _ = model._split_segments_by_timestamps(
+            tokenizer=tokenizer,
+            tokens=result.sequences_ids[0],
+            time_offset=start,
+            segment_size=int(math.ceil(end - start) * model.frames_per_second),
+            segment_duration=end - start,
+            seek=0,
+        )
+        segments = [{**sub, "text": tokenizer.decode(sub["tokens"])} for sub in subsegments]
+        return segments, temperature
+
+
+_BATCHERS: Dict[str, TranscriptionBatcher] = {}
+
+
+def _get_batcher(model_size: str) -> TranscriptionBatcher:
+    if model_size not in _BATCHERS:
+        _BATCHERS[model_size] = TranscriptionBatcher(model_size)
+    return _BATCHERS[model_size]
 
 
 # Language mapping for better Gemini prompts
@@ -63,126 +537,591 @@ LANGUAGE_NAMES = {
     "zh": "Chinese"
 }
 
-def transcribe_video(
-    video_path: Path,
-    output_dir: Path,
-    model_size: str = "base",
-    target_lang: str = "en",
-) -> Tuple[List[Dict], Path]:
-    """Transcribe audio and translate if needed. Returns (segments, srt_path)."""
+# Leading "N. " / "N) " numbering on Gemini's output lines
+_NUM_PREFIX = re.compile(r"\s*\d+[.)]\s+(.*)")
 
-    model = whisper.load_model(model_size)
-    result = model.transcribe(str(video_path))
-    segments = result["segments"]
-
-    # Whisper transcribes in the original language (Japanese in this case)
-    # We need to translate to the target language regardless of what it is
-    # For English subtitles, we need to translate Japanese to English
-    # For other languages, we need to translate Japanese to that language
-    
-    # Check if we have any text to translate
-    if not segments or not any(seg["text"].strip() for seg in segments):
-        print("No text found to translate")
-        lang_suffix = target_lang
-        srt_path = output_dir / f"{video_path.stem}.{lang_suffix}.srt"
-        _write_srt(segments, srt_path)
-        return segments, srt_path
-    
-    print(f"Translating Japanese audio to {target_lang}...")
-    # Use Gemini to translate while preserving alignment.
-    texts = [seg["text"] for seg in segments]
-    
-    # Store original text for debugging
-    for seg in segments:
-        seg["original_text"] = seg["text"]
-
-    cleaned_all: list[str] = []
-    chunk_size = 80  # translate max 80 lines per call to stay under token limit
+# Maximum number of Gemini requests in flight across all videos in this process
+GEMINI_CONCURRENCY = 8
+
+_GEMINI_SEM: Optional[asyncio.Semaphore] = None
+_GEMINI_SEM_LOOP: Optional[asyncio.AbstractEventLoop] = None
 
-    for start in range(0, len(texts), chunk_size):
-        chunk = texts[start : start + chunk_size]
-        numbered = "\n".join(f"{idx+1}. {t}" for idx, t in enumerate(chunk))
-        target_lang_name = LANGUAGE_NAMES.get(target_lang, target_lang)
-        prompt = (
-            f"Translate the following subtitles into {target_lang_name}.\n"
-            "Keep the original numbering, one line per subtitle, and output nothing else.\n"
-            "Ensure the translation is natural and contextually appropriate.\n\n"
-            f"{numbered}"
-        )
 
+def _gemini_semaphore() -> asyncio.Semaphore:
+    """The process-wide limit on Gemini requests, (re)created for the running event loop."""
+    global _GEMINI_SEM, _GEMINI_SEM_LOOP
+    loop = asyncio.get_running_loop()
+    if _GEMINI_SEM is None or _GEMINI_SEM_LOOP is not loop:
+        _GEMINI_SEM, _GEMINI_SEM_LOOP = asyncio.Semaphore(GEMINI_CONCURRENCY), loop
+    return _GEMINI_SEM
+
+
+async def _translate_chunk(chunk: List[str], target_lang_name: str) -> List[str]:
+    """Translate one chunk of subtitle lines, retrying once with a simpler prompt."""
+    numbered = "\n".join(f"{idx+1}. {t}" for idx, t in enumerate(chunk))
+    prompt = (
+        f"Translate the following subtitles into {target_lang_name}.\n"
+        "Keep the original numbering, one line per subtitle, and output nothing else.\n"
+        "Ensure the translation is natural and contextually appropriate.\n\n"
+        f"{numbered}"
+    )
+
+    model = _get_gemini()
+    async with _gemini_semaphore():
         try:
-            resp = _GEMINI_MODEL.generate_content(prompt)
+            resp = await model.generate_content_async(prompt)
             if not resp.text:
                 raise RuntimeError("Empty response from Gemini")
-            lines = [ln.strip() for ln in resp.text.split("\n") if ln.strip()]
-            print(f"Gemini response for chunk {start//chunk_size + 1}: {len(lines)} lines")
+            return [ln.strip() for ln in resp.text.splitlines() if ln.strip()]
         except Exception as e:
             print(f"Gemini API error: {e}")
             print(f"Prompt sent: {prompt}")
             # Try with a simpler prompt as fallback
             try:
                 simple_prompt = f"Translate these Japanese subtitles to {target_lang_name}:\n{numbered}"
-                resp = _GEMINI_MODEL.generate_content(simple_prompt)
+                resp = await model.generate_content_async(simple_prompt)
                 if resp.text:
-                    lines = [ln.strip() for ln in resp.text.split("\n") if ln.strip()]
+                    lines = [ln.strip() for ln in resp.text.splitlines() if ln.strip()]
                     print(f"Fallback translation successful: {len(lines)} lines")
-                else:
-                    raise RuntimeError("Empty response from fallback translation")
+                    return lines
+                raise RuntimeError("Empty response from fallback translation")
             except Exception as fallback_e:
                 print(f"Fallback translation also failed: {fallback_e}")
-                raise RuntimeError(f"Gemini translation failed: {e}")
+                if isinstance(e, google_exceptions.GoogleAPIError):
+                    raise TranslationUnavailable(f"Gemini translation failed: {e}") from e
+                raise RuntimeError(f"Gemini translation failed: {e}") from e
+
+
+def _srt_path(video_path: Path, output_dir: Path, target_lang: str) -> Path:
+    lang_suffix = target_lang
+    return output_dir / f"{video_path.stem}.{lang_suffix}.srt"
+
+
+def _chunk(index: int, segments: List[Dict], start: int, stop: int) -> Dict:
+    """Describe segments[start:stop] plus the slice of video it covers.
+
+    A chunk's span runs from its first segment (0 for the first chunk) to the
+    first segment of the next chunk, or to the end of the video (``end=None``),
+    so consecutive chunks tile the whole video.
+    """
+    return {
+        "index": index,
+        "offset": start,  # position of the chunk's first segment in the transcript
+        "start": segments[start]["start"] if start > 0 else 0.0,
+        "end": segments[stop]["start"] if stop < len(segments) else None,
+        "segments": segments[start:stop],
+    }
+
+
+async def _translate_chunked(segments: List[Dict], texts: List[str], target_lang_name: str) -> AsyncIterator[Dict]:
+    """Translate in numbered 80-line chunks, yielding each chunk as it completes.
+
+    A chunk whose missing lines were filled with the source text has
+    ``"padded": True``.
+    """
+    chunk_size = 80  # translate max 80 lines per call to stay under token limit
 
-        # Strip leading numbers "N. "
-        for ln in lines:
-            if ln.split(" ")[0].rstrip(".").isdigit():
-                cleaned_all.append(" ".join(ln.split(" ")[1:]))
-            else:
-                cleaned_all.append(ln)
+    async def translate(start: int) -> Tuple[int, List[str]]:
+        return start, await _translate_chunk(texts[start : start + chunk_size], target_lang_name)
 
-    if len(cleaned_all) != len(segments):
-        print(f"Warning: Translation line count mismatch: expected {len(segments)}, got {len(cleaned_all)}")
+    # Fire every chunk at once; the process-wide semaphore keeps all uploads
+    # together within Gemini's QPS limits.
+    # Chunks are handed on in completion order so burning can start early.
+    tasks = [asyncio.ensure_future(translate(start)) for start in range(0, len(texts), chunk_size)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                start, lines = await next_done
+            except TranslationUnavailable:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"Gemini translation failed: {e}") from e
+            print(f"Gemini response for chunk {start//chunk_size + 1}: {len(lines)} lines")
+
+            chunk = texts[start : start + chunk_size]
+            # Strip leading numbers "N. "
+            cleaned = []
+            for ln in lines:
+                m = _NUM_PREFIX.match(ln)
+                cleaned.append(m.group(1) if m else ln)
+
+            padded = len(cleaned) != len(chunk)
+            if padded:
+                print(f"Warning: Translation line count mismatch in chunk {start//chunk_size + 1}: expected {len(chunk)}, got {len(cleaned)}")
+                print("Using original text for missing translations")
+                # Pad with original text if translation is incomplete
+                cleaned = cleaned[: len(chunk)] + chunk[len(cleaned) :]
+
+            for seg, tr in zip(segments[start : start + chunk_size], cleaned):
+                seg["text"] = tr
+                print(f"Original: {seg.get('original_text', 'N/A')} -> Translated: {tr}")
+
+            yield {**_chunk(start // chunk_size, segments, start, start + chunk_size), "padded": padded}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# Gemini 1.5 Flash caps a response at 8192 tokens, and the translation is
+# about as long as its input, so only short transcripts fit in one call.
+GEMINI_SINGLE_CALL_MAX_TOKENS = 6000
+
+_JSON_LIST_CONFIG = genai.GenerationConfig(response_mime_type="application/json", response_schema=list[str])
+
+
+async def _translate_all(texts: List[str], target_lang_name: str) -> Optional[Tuple[List[str], bool]]:
+    """Translate the whole transcript in one JSON-mode call.
+
+    Returns (translations, padded), where ``padded`` means missing lines were
+    filled with the source text. Returns None when the transcript is too long
+    for a single response or the call fails, so the caller can use the
+    chunked path instead.
+    """
+    model = _get_gemini()
+    payload = json.dumps([{"i": i, "t": t} for i, t in enumerate(texts)], ensure_ascii=False)
+    prompt = (
+        f"Translate the text \"t\" of each subtitle below into {target_lang_name}.\n"
+        "Return a JSON array of strings with exactly one translation per subtitle, in the same order.\n"
+        "Ensure the translation is natural and contextually appropriate.\n\n"
+        f"{payload}"
+    )
+
+    try:
+        async with _gemini_semaphore():
+            tokens = (await model.count_tokens_async(prompt)).total_tokens
+            if tokens > GEMINI_SINGLE_CALL_MAX_TOKENS:
+                print(f"Transcript is {tokens} tokens; translating in chunks")
+                return None
+            resp = await model.generate_content_async(prompt, generation_config=_JSON_LIST_CONFIG)
+        translated = json.loads(resp.text)
+        if not isinstance(translated, list) or not all(isinstance(t, str) for t in translated):
+            raise ValueError("response is not a JSON array of strings")
+    except Exception as e:
+        print(f"Single-call translation failed, falling back to chunks: {e}")
+        return None
+
+    print(f"Gemini returned {len(translated)} translations in one call")
+    padded = len(translated) != len(texts)
+    if padded:
+        print(f"Warning: Translation line count mismatch: expected {len(texts)}, got {len(translated)}")
         print("Using original text for missing translations")
-        # Pad with original text if translation is incomplete
-        while len(cleaned_all) < len(segments):
-            cleaned_all.append(segments[len(cleaned_all)]["text"])
+        translated = translated[: len(texts)] + texts[len(translated) :]
+    return [t.strip() for t in translated], padded
 
-    for seg, tr in zip(segments, cleaned_all):
-        seg["text"] = tr
-        print(f"Original: {seg.get('original_text', 'N/A')} -> Translated: {tr}")
 
-    lang_suffix = target_lang
-    srt_path = output_dir / f"{video_path.stem}.{lang_suffix}.srt"
-    _write_srt(segments, srt_path)
-    return segments, srt_path
+async def _chunks_as_decoded(decoded: AsyncIterator[List[Dict]], segments: List[Dict]) -> AsyncIterator[Dict]:
+    """Append each decoded batch to ``segments`` and yield chunks as Whisper goes.
+
+    A chunk's span ends where the next chunk starts, so each one is yielded
+    when the following batch arrives. The last chunk runs to the end of the
+    video; a short video decoded in a single step gives a single chunk.
+    """
+    index = start = 0
+    async for batch in decoded:
+        stop = len(segments)
+        segments.extend({"id": stop + n, **seg} for n, seg in enumerate(batch))
+        if batch and stop > start:
+            yield _chunk(index, segments, start, stop)
+            index, start = index + 1, stop
+    yield _chunk(index, segments, start, len(segments))
+
+
+async def transcribe_stream(
+    video_path: Path,
+    output_dir: Path,
+    model_size: str = "base",
+    target_lang: str = "en",
+) -> AsyncIterator[Dict]:
+    """Transcribe and translate, yielding chunks as soon as each one is ready.
+
+    Without Gemini, chunks follow Whisper's decode steps; translated chunks
+    are yielded as each translation returns. Chunks (see ``_chunk``) can
+    arrive out of order. Once the last one is
+    yielded, the full SRT is written to ``_srt_path(...)`` and the transcript
+    is cached.
+    """
+    srt_path = _srt_path(video_path, output_dir, target_lang)
+
+    # Hashing, cache I/O and SRT writes are blocking file work; keep them off
+    # the event loop so other requests are served while a video is processed.
+    cache_path = video_hash = None
+    if _transcript_cache_enabled():
+        video_hash = await asyncio.to_thread(_file_sha256, video_path)
+        cache_path = _transcript_cache_path(video_hash, model_size, target_lang)
+        cached = await asyncio.to_thread(_load_cached_transcript, cache_path)
+        if cached is not None:
+            print(f"Transcript cache hit for {video_path.name}")
+            await asyncio.to_thread(_write_srt, cached, srt_path)
+            yield _chunk(0, cached, 0, len(cached))
+            return
+
+    audio = await asyncio.to_thread(_load_audio, video_path, video_hash)
+    # Whisper can translate any language into English itself, so English
+    # subtitles never need Gemini; other targets are transcribed as spoken.
+    task = "translate" if target_lang == "en" else "transcribe"
+    language, decoded = await _get_batcher(model_size).transcribe(audio, task)
+    segments: List[Dict] = []
+    # Set when Gemini dropped lines and the source text stands in for them;
+    # such a transcript is served this once but never cached.
+    padded = False
+
+    if task == "translate" or language == target_lang:
+        # Already in the target language (spoken that way, or Whisper translated
+        # it), so segments are handed on while Whisper is still decoding.
+        print(f"Whisper output ({language}, {task}) is already {target_lang}; skipping Gemini")
+        async for chunk in _chunks_as_decoded(decoded, segments):
+            yield chunk
+    else:
+        async for batch in decoded:
+            segments.extend({"id": len(segments) + n, **seg} for n, seg in enumerate(batch))
 
+        # Check if we have any text to translate
+        if not any(seg["text"].strip() for seg in segments):
+            print("No text found to translate")
+            await asyncio.to_thread(_write_srt, segments, srt_path)
+            yield _chunk(0, segments, 0, len(segments))
+            return
 
-def burn_subtitles(video_path: Path, srt_path: Path, output_dir: Path, target_lang: str = "en") -> Path:
-    """Burn SRT into video and return path."""
-    out_file = output_dir / f"{video_path.stem}.{target_lang}_burned.mp4"
-    
+        print(f"Translating {language} audio to {target_lang}...")
+        # Use Gemini to translate while preserving alignment.
+        texts = [seg["text"] for seg in segments]
+
+        # Store original text for debugging
+        for seg in segments:
+            seg["original_text"] = seg["text"]
+
+        target_lang_name = LANGUAGE_NAMES.get(target_lang, target_lang)
+
+        # One structured call for the whole transcript when it fits; otherwise
+        # (or if that call fails) fall back to concurrent numbered chunks.
+        result = await _translate_all(texts, target_lang_name)
+        if result is not None:
+            translated, padded = result
+            for seg, tr in zip(segments, translated):
+                seg["text"] = tr
+                print(f"Original: {seg.get('original_text', 'N/A')} -> Translated: {tr}")
+            yield _chunk(0, segments, 0, len(segments))
+        else:
+            async for chunk in _translate_chunked(segments, texts, target_lang_name):
+                padded = padded or chunk["padded"]
+                yield chunk
+
+    if padded:
+        print("Not caching a partly untranslated transcript")
+    elif cache_path is not None:
+        await asyncio.to_thread(
+            _store_cached_transcript,
+            cache_path, segments, video_hash=video_hash, model_size=model_size, target_lang=target_lang,
+        )
+
+    await asyncio.to_thread(_write_srt, segments, srt_path)
+
+
+async def transcribe_video(
+    video_path: Path,
+    output_dir: Path,
+    model_size: str = "base",
+    target_lang: str = "en",
+) -> Tuple[List[Dict], Path]:
+    """Transcribe audio and translate if needed. Returns (segments, srt_path)."""
+    chunks = [chunk async for chunk in transcribe_stream(video_path, output_dir, model_size, target_lang)]
+    segments = [seg for chunk in sorted(chunks, key=lambda c: c["index"]) for seg in chunk["segments"]]
+    return segments, _srt_path(video_path, output_dir, target_lang)
+
+
+_SUBTITLE_STYLE = "FontSize=24,PrimaryColour=&Hffffff&,OutlineColour=&H000000&,BorderStyle=3"
+
+# H.264 encoders with settings roughly matching libx264 ultrafast / crf 28.
+# Hardware encoders are preferred when ffmpeg lists them and a probe encode works.
+_ENCODER_ARGS = {
+    "h264_nvenc": {"preset": "p4", "rc": "vbr", "cq": 28, "b:v": 0},
+    "h264_videotoolbox": {"b:v": "5M"},
+    "h264_qsv": {"preset": "veryfast", "global_quality": 28},
+    "libx264": {"preset": "ultrafast", "crf": 28},
+}
+
+
+def _probe_encoder(encoder: str) -> bool:
+    """Encode a few blank frames to check the encoder actually works on this host."""
     try:
-        print(f"Starting subtitle burning for {target_lang}...")
-        
-        # More efficient approach with better encoding settings
         (
-            ffmpeg.input(str(video_path))
-            .output(
+            ffmpeg.input("color=black:s=256x256:d=0.1", f="lavfi")
+            .output("-", f="null", vcodec=encoder, **_ENCODER_ARGS[encoder])
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        return True
+    except ffmpeg.Error:
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def detect_video_encoder() -> str:
+    """Pick the fastest working H.264 encoder (VIDEO_ENCODER overrides)."""
+    override = os.getenv("VIDEO_ENCODER")
+    if override:
+        return override
+    try:
+        listed = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "libx264"
+    candidates = ["h264_videotoolbox"] if sys.platform == "darwin" else ["h264_nvenc", "h264_qsv"]
+    for encoder in candidates:
+        if f" {encoder} " in listed and _probe_encoder(encoder):
+            print(f"Using hardware video encoder {encoder}")
+            return encoder
+    return "libx264"
+
+
+@functools.lru_cache(maxsize=None)
+def _cuda_decode_available() -> bool:
+    try:
+        listed = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-hwaccels"], capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return "cuda" in listed.split()
+
+
+def _subtitles_filter(srt_path: Path) -> str:
+    return f"subtitles='{srt_path.as_posix()}':force_style='{_SUBTITLE_STYLE}'"
+
+
+def _ffmpeg_error(e: ffmpeg.Error) -> RuntimeError:
+    print(f"FFmpeg error: {e.stderr.decode() if e.stderr else str(e)}")
+    return RuntimeError(f"ffmpeg error:\n{e.stderr.decode() if e.stderr else str(e)}\n")
+
+
+def _encode_args(srt_path: Optional[Path], hw_decode: bool) -> Tuple[Dict, Dict]:
+    """Return (input kwargs, output kwargs) for the chosen encoder, burning srt_path if given."""
+    encoder = detect_video_encoder()
+    input_args: Dict = {}
+    output_args = dict(_ENCODER_ARGS.get(encoder, {}), vcodec=encoder)
+    use_cuda = hw_decode and encoder == "h264_nvenc" and _cuda_decode_available()
+    if use_cuda:
+        input_args = {"hwaccel": "cuda", "hwaccel_output_format": "cuda"}
+    if srt_path is not None:
+        subtitles = _subtitles_filter(srt_path)
+        # NVDEC frames stay in GPU memory; only the subtitles filter runs on the CPU.
+        output_args["vf"] = f"hwdownload,format=nv12,{subtitles},hwupload_cuda" if use_cuda else subtitles
+    return input_args, output_args
+
+
+def _encode_video(video_path: Path, out_file: Path, srt_path: Optional[Path], input_args: Dict, output_args: Dict) -> None:
+    """Re-encode video_path into out_file, retrying with CPU decoding if hardware decoding fails."""
+    for hw_decode in (True, False):
+        decode_args, encode_args = _encode_args(srt_path, hw_decode)
+        try:
+            (
+                ffmpeg.input(str(video_path), **input_args, **decode_args)
+                .output(str(out_file), **output_args, **encode_args)
+                .overwrite_output()
+                .run(capture_stdout=True, capture_stderr=True)
+            )
+            return
+        except ffmpeg.Error as e:
+            if not decode_args:
+                raise _ffmpeg_error(e) from e
+            print("Hardware decoding failed, retrying with CPU decoding")
+
+
+# "soft" muxes the subtitles as a selectable track (no re-encode);
+# "burn" renders them into the video frames.
+SUBTITLE_MODES = ("soft", "burn")
+
+
+def _output_path(video_path: Path, output_dir: Path, target_lang: str, mode: str) -> Path:
+    if mode not in SUBTITLE_MODES:
+        raise ValueError(f"mode must be one of {SUBTITLE_MODES}")
+    suffix = "soft" if mode == "soft" else "burned"
+    return output_dir / f"{video_path.stem}.{target_lang}_{suffix}.mp4"
+
+
+def _mux_soft_subtitles(video_path: Path, srt_path: Optional[Path], out_file: Path) -> None:
+    """Copy video and audio untouched and add the SRT as a mov_text subtitle track.
+
+    Pass ``srt_path=None`` when there are no cues (silent or music-only clips):
+    ffmpeg rejects an empty SRT as an input, so only video and audio are copied.
+    """
+    try:
+        video_in = ffmpeg.input(str(video_path))
+        streams = [video_in["v"], video_in["a?"]]
+        subtitle_args = {}
+        if srt_path is not None:
+            streams.append(ffmpeg.input(str(srt_path)))
+            subtitle_args["scodec"] = "mov_text"
+        (
+            ffmpeg.output(
+                *streams,
                 str(out_file),
-                vf=f"subtitles='{srt_path.as_posix()}':force_style='FontSize=24,PrimaryColour=&Hffffff&,OutlineColour=&H000000&,BorderStyle=3'",
-                vcodec="libx264",
-                acodec="copy",  # Copy audio instead of re-encoding - MUCH FASTER
-                preset="ultrafast",  # Use ultrafast encoding preset
-                crf=28,  # Slightly lower quality but much faster
+                vcodec="copy",
+                acodec="copy",
+                **subtitle_args,
                 movflags="+faststart",
-                loglevel="info"
+                loglevel="error",
             )
             .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True, quiet=False)
+            .run(capture_stdout=True, capture_stderr=True)
         )
-        print(f"Subtitle burning completed: {out_file}")
     except ffmpeg.Error as e:
-        print(f"FFmpeg error: {e.stderr.decode() if e.stderr else str(e)}")
-        raise RuntimeError(f"ffmpeg error:\n{e.stderr.decode() if e.stderr else str(e)}\n") from e
+        raise _ffmpeg_error(e) from e
+
+
+def burn_subtitles(
+    video_path: Path, srt_path: Path, output_dir: Path, target_lang: str = "en", mode: str = "soft"
+) -> Path:
+    """Add SRT subtitles to the video (soft track or burned in) and return path."""
+    out_file = _output_path(video_path, output_dir, target_lang, mode)
+
+    if mode == "soft":
+        print(f"Muxing {target_lang} subtitle track...")
+        _mux_soft_subtitles(video_path, srt_path if srt_path.stat().st_size else None, out_file)
+        print(f"Subtitle muxing completed: {out_file}")
+        return out_file
+
+    print(f"Starting subtitle burning for {target_lang}...")
+    _burn_whole(video_path, srt_path, out_file)
+    print(f"Subtitle burning completed: {out_file}")
+    return out_file
+
+
+def _burn_whole(video_path: Path, srt_path: Optional[Path], out_file: Path) -> None:
+    """Re-encode the whole video in one pass, burning srt_path in if given."""
+    _encode_video(
+        video_path,
+        out_file,
+        srt_path,
+        {},
+        {
+            "acodec": "copy",  # Copy audio instead of re-encoding - MUCH FASTER
+            "movflags": "+faststart",
+            "loglevel": "info",
+        },
+    )
+
+
+# Maximum number of pieces encoded at once by burn_subtitles_streaming
+BURN_CONCURRENCY = 2
+
+
+def _burn_piece(video_path: Path, chunk: Dict, piece_dir: Path) -> Path:
+    """Encode one chunk's span of the video (video only) with its subtitles burned in."""
+    piece_path = piece_dir / f"piece_{chunk['index']:04d}.mp4"
+    offset = chunk["start"]
+
+    # The piece's timestamps restart at 0, so shift its subtitles to match.
+    srt_path = piece_dir / f"piece_{chunk['index']:04d}.srt"
+    _write_srt(
+        [{**seg, "start": max(seg["start"] - offset, 0.0), "end": seg["end"] - offset} for seg in chunk["segments"]],
+        srt_path,
+    )
+
+    input_args = {"ss": offset}
+    if chunk["end"] is not None:
+        input_args["t"] = chunk["end"] - offset
+    has_text = any(seg["text"].strip() for seg in chunk["segments"])
+    _encode_video(video_path, piece_path, srt_path if has_text else None, input_args, {"an": None, "loglevel": "error"})
+    return piece_path
+
+
+def _concat_pieces(video_path: Path, pieces: List[Path], out_file: Path) -> None:
+    """Join encoded pieces without re-encoding and mux the untouched original audio."""
+    list_path = pieces[0].parent / "pieces.txt"
+    list_path.write_text("".join(f"file '{p.resolve().as_posix()}'\n" for p in pieces), encoding="utf-8")
+    try:
+        video = ffmpeg.input(str(list_path), f="concat", safe=0)
+        source = ffmpeg.input(str(video_path))
+        (
+            ffmpeg.output(video["v"], source["a?"], str(out_file), c="copy", movflags="+faststart", loglevel="error")
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        raise _ffmpeg_error(e) from e
+
+
+async def _to_thread_waiting(func, *args):
+    """``asyncio.to_thread`` that, when cancelled, waits for the thread before re-raising.
+
+    A running ffmpeg call can't be interrupted, so this keeps the temp files it
+    reads and writes alive until it has actually exited.
+    """
+    work = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(work)
+    finally:
+        if not work.done():
+            await asyncio.wait([work])
+
+
+async def burn_subtitles_streaming(
+    video_path: Path,
+    chunks: "asyncio.Queue[Optional[Dict]]",
+    output_dir: Path,
+    target_lang: str = "en",
+    mode: str = "soft",
+) -> Path:
+    """Add subtitles while transcription is still running.
+
+    Consumes chunks (as yielded by ``transcribe_stream``) from ``chunks`` until
+    a ``None`` sentinel arrives. In "burn" mode each chunk's span of the video
+    is encoded as soon as it is available, then the pieces are concatenated
+    with the original audio stream copied in. "soft" mode only needs the
+    finished transcript: it waits for every chunk and muxes a subtitle track,
+    plus a WebVTT file next to the output for in-browser playback.
+    """
+    out_file = _output_path(video_path, output_dir, target_lang, mode)
+    sem = asyncio.Semaphore(BURN_CONCURRENCY)
+
+    async def burn(chunk: Dict, piece_dir: Path) -> Tuple[int, Path]:
+        async with sem:
+            return chunk["index"], await _to_thread_waiting(_burn_piece, video_path, chunk, piece_dir)
+
+    with tempfile.TemporaryDirectory(prefix=".pieces_", dir=output_dir) as tmp:
+        piece_dir = Path(tmp)
+
+        if mode == "soft":
+            received = []
+            while (chunk := await chunks.get()) is not None:
+                received.append(chunk)
+            segments = [seg for chunk in sorted(received, key=lambda c: c["index"]) for seg in chunk["segments"]]
+            srt_path = piece_dir / "subtitles.srt"
+            await asyncio.to_thread(_write_srt, segments, srt_path)
+            await asyncio.to_thread(_write_vtt, segments, out_file.with_suffix(".vtt"))
+            print(f"Muxing {target_lang} subtitle track...")
+            await _to_thread_waiting(_mux_soft_subtitles, video_path, srt_path if segments else None, out_file)
+            print(f"Subtitle muxing completed: {out_file}")
+            return out_file
+
+        print(f"Starting subtitle burning for {target_lang}...")
+        chunk = await chunks.get()
+        if chunk is not None and chunk["start"] == 0 and chunk["end"] is None:
+            # A single chunk spanning the whole video (English target, one-call
+            # translation, cache hit): encode once with the audio copied, as
+            # burn_subtitles does, instead of a piece plus a concat remux.
+            srt_path = piece_dir / "subtitles.srt"
+            await asyncio.to_thread(_write_srt, chunk["segments"], srt_path)
+            has_text = any(seg["text"].strip() for seg in chunk["segments"])
+            await _to_thread_waiting(_burn_whole, video_path, srt_path if has_text else None, out_file)
+        else:
+            tasks: List[asyncio.Task] = []
+            try:
+                while chunk is not None:
+                    tasks.append(asyncio.ensure_future(burn(chunk, piece_dir)))
+                    chunk = await chunks.get()
+                pieces = [path for _, path in sorted(await asyncio.gather(*tasks))]
+            finally:
+                # On cancellation or a failed piece: drop queued pieces, and let the
+                # ones already encoding exit before piece_dir is removed.
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if not pieces:
+                raise RuntimeError("No subtitle chunks to burn")
+            await _to_thread_waiting(_concat_pieces, video_path, pieces, out_file)
+    print(f"Subtitle burning completed: {out_file}")
     return out_file
 
 
@@ -241,7 +1180,7 @@ def process_video(
     output_dir.mkdir(parents=True, exist_ok=True)
 
     # transcription + optional translation
-    segments, srt_path = transcribe_video(video, output_dir, target_lang=target_lang)
+    segments, srt_path = asyncio.run(transcribe_video(video, output_dir, target_lang=target_lang))
     transcript_text = " ".join(seg["text"] for seg in segments)
 
     if mode == "sub":
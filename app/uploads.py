@@ -0,0 +1,145 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiofiles
+from fastapi import Request
+
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Limit on the combined size of the non-file form fields kept in memory
+MAX_FIELDS_SIZE = 64 * 1024
+
+
+class InvalidUpload(ValueError):
+    """The request body is not an acceptable multipart video upload."""
+
+
+async def save_multipart_upload(
+    request: Request,
+    file_field: str,
+    dest: Callable[[str], Path],
+    content_type_prefix: str = "video",
+) -> Tuple[Path, Dict[str, str]]:
+    """Parse multipart/form-data straight from ``request.stream()``.
+
+    The ``file_field`` part is written to ``dest(filename)`` chunk by chunk as
+    the body arrives, so memory stays flat however large or numerous the
+    uploads are and the bytes hit the disk exactly once (Starlette's form
+    parser buffers up to 1 MB per file in RAM, then spools to a temp file
+    that still has to be copied). Other parts are small text fields returned
+    as a dict. Raises InvalidUpload on malformed or unacceptable bodies.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidUpload("Expected a multipart/form-data body")
+
+    fields: Dict[str, bytearray] = {}
+    fields_size = 0
+    headers: Dict[bytes, bytes] = {}
+    header_field, header_value = bytearray(), bytearray()
+    part_name: Optional[str] = None
+    in_file = False
+    file_path: Optional[Path] = None
+    pending: List[bytes] = []  # file bytes parsed from the current network chunk
+    error: Optional[str] = None
+    complete = False  # set once the closing --boundary-- has been parsed
+
+    def on_part_begin():
+        nonlocal part_name, in_file
+        headers.clear()
+        part_name, in_file = None, False
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        nonlocal part_name, in_file, file_path, error
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        part_name = options.get(b"name", b"").decode("utf-8", "replace")
+        if part_name != file_field:
+            fields[part_name] = bytearray()
+            return
+        part_type = headers.get(b"content-type", b"").decode("latin-1")
+        if not part_type.startswith(content_type_prefix):
+            error = f"Please upload a {content_type_prefix} file"
+        elif file_path is not None:
+            error = f"Only one {file_field!r} part is allowed"
+        else:
+            in_file = True
+            file_path = dest(options.get(b"filename", b"upload").decode("utf-8", "replace"))
+
+    def on_part_data(data, start, end):
+        nonlocal fields_size, error
+        if in_file:
+            pending.append(bytes(data[start:end]))
+        elif part_name in fields:
+            fields_size += end - start
+            if fields_size > MAX_FIELDS_SIZE:
+                error = "Form fields too large"
+            else:
+                fields[part_name].extend(data[start:end])
+
+    def on_end():
+        nonlocal complete
+        complete = True
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_part_data": on_part_data,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_end": on_end,
+        },
+    )
+
+    out = None
+    try:
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if error:
+                    raise InvalidUpload(error)
+                if file_path is not None and out is None:
+                    out = await aiofiles.open(file_path, "wb")
+                if pending:
+                    await out.write(b"".join(pending))
+                    pending.clear()
+            parser.finalize()
+        except MultipartParseError as e:
+            raise InvalidUpload(f"Malformed multipart body: {e}") from e
+        # finalize() doesn't check this itself: a body cut off mid-part ends
+        # without the closing boundary and must not be taken as a full upload.
+        if not complete:
+            raise InvalidUpload("Truncated multipart body")
+        if file_path is None:
+            raise InvalidUpload(f"Missing {file_field!r} file part")
+    except BaseException:
+        # Invalid body or client disconnect: don't leave a partial upload behind
+        if out is not None:
+            await out.close()
+            out = None
+        if file_path is not None:
+            file_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if out is not None:
+            await out.close()
+
+    return file_path, {name: value.decode("utf-8", "replace") for name, value in fields.items()}